@@ -1,15 +1,25 @@
 #!/usr/bin/env python3
-import os, csv, json, time, sys
-from datetime import datetime, timezone
+import os, csv, gzip, hashlib, io, pickle, queue, sys, threading
+from operator import itemgetter
+import orjson
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
 from typing import List, Dict, Any
 import requests
-from flask import Flask, jsonify, send_file, Response
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from flask import Flask, jsonify, redirect, request, send_file, Response
 from google.cloud import storage
+from google.cloud.exceptions import NotFound
 
 # ----------------------------
 # Config
 # ----------------------------
 CSV_PATH = os.getenv("CSV_PATH", "/tmp/pollution_data.csv")
+POLL_WORKERS = int(os.getenv("POLL_WORKERS", "16"))
+LATEST_MAX_AGE_HOURS = int(os.getenv("LATEST_MAX_AGE_HOURS", "24"))
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "/tmp/latest_cache.pkl")
 HOST = os.getenv("HOST", "0.0.0.0")
 PORT = int(os.getenv("PORT", "8080"))
 
@@ -20,28 +30,67 @@ CSV_FILENAME = "air_quality_data.csv"
 # Google Air Quality API
 AIR_QUALITY_URL = "https://airquality.googleapis.com/v1/currentConditions:lookup"
 API_KEY = os.getenv("GOOGLE_AIR_QUALITY_API_KEY")
-
-# Geolocations of all the 73 Clarity sensors 
+REQUEST_URL = f"{AIR_QUALITY_URL}?key={API_KEY}"
+
+# One pooled session for all API calls: keep-alive amortizes the TLS
+# handshake across locations, and retries cover transient 429/5xx errors
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=POLL_WORKERS,
+    pool_maxsize=POLL_WORKERS,
+    # allowed_methods must include POST explicitly - urllib3's default set
+    # excludes it, and every call here is a POST. The lookups are idempotent
+    # reads, so retrying them on 429/5xx is safe.
+    max_retries=Retry(total=3, backoff_factor=0.2,
+                      status_forcelist=[429, 500, 502, 503, 504],
+                      allowed_methods=frozenset({"POST"}))
+))
+
+# Immutable per-sensor record: attribute access is cheaper than dict lookups
+# in the poll loop, and frozen+slots keeps the footprint small
+@dataclass(frozen=True, slots=True)
+class Location:
+    label: str
+    latitude: float
+    longitude: float
+    description: str
+
+# Geolocations of all the 73 Clarity sensors
 def load_monitoring_locations():
     try:
-        with open("monitoring_locations.json", "r", encoding="utf-8") as f:
-            locations = json.load(f)
+        with open("monitoring_locations.json", "rb") as f:
+            locations = tuple(
+                Location(d["label"], d["latitude"], d["longitude"], d["description"])
+                for d in orjson.loads(f.read())
+            )
         print(f"Loaded {len(locations)} monitoring locations from JSON")
         return locations
     except FileNotFoundError:
         print("monitoring_locations.json not found. Using default locations.")
         # Fallback to original locations if JSON doesn't exist
-        return [
-            {
-                "label": "Yerevan_Center",
-                "latitude": 40.1814,
-                "longitude": 44.5146,
-                "description": "Yerevan City Center - Republic Square"
-            }
-        ]
+        return (
+            Location(
+                label="Yerevan_Center",
+                latitude=40.1814,
+                longitude=44.5146,
+                description="Yerevan City Center - Republic Square"
+            ),
+        )
 
 MONITORING_LOCATIONS = load_monitoring_locations()
 
+# Request bodies never change between polls, so serialize each one once at
+# load time and POST the prebuilt bytes instead of re-encoding per call
+REQUEST_HEADERS = {"Content-Type": "application/json"}
+REQUEST_BODIES = {
+    location.label: orjson.dumps({
+        "location": {"latitude": location.latitude, "longitude": location.longitude},
+        "extraComputations": ["POLLUTANT_CONCENTRATION"],
+        "universalAqi": True
+    })
+    for location in MONITORING_LOCATIONS
+}
+
 # old monitoring stations 
 '''
 MONITORING_LOCATIONS = [
@@ -102,12 +151,25 @@ POLLUTANT_INFO = {
     'PM10': {'name': 'PM10', 'units': 'μg/m³', 'column_suffix': 'ugm3'}
 }
 
+# Column names derived once here instead of f-string rebuilds per row
+POLLUTANT_COLUMNS = {
+    code: f"{code}_{info['column_suffix']}" for code, info in POLLUTANT_INFO.items()
+}
+
+# Prebuilt empty-columns template: row init becomes one dict.update instead
+# of a Python-level loop over POLLUTANT_INFO for every row
+EMPTY_POLLUTANT_COLUMNS = {column: None for column in POLLUTANT_COLUMNS.values()}
+
 # CSV headers
 CSV_HEADER = [
     "timestamp_utc", "location_label", "latitude", "longitude", "description",
     "overall_aqi", "CO_ppb", "NO2_ppb", "O3_ppb", "SO2_ppb", "PM25_ugm3", "PM10_ugm3"
 ]
 
+# Extracts row values in header order in one C-level call, so writers can
+# use plain csv.writer instead of DictWriter's per-row key lookups
+CSV_ROW_GETTER = itemgetter(*CSV_HEADER)
+
 # Cloud Storage Functions
 def save_to_cloud_storage():
     """Save CSV to Cloud Storage"""
@@ -116,13 +178,85 @@ def save_to_cloud_storage():
         bucket = client.bucket(BUCKET_NAME)
         blob = bucket.blob(CSV_FILENAME)
         
-        blob.upload_from_filename(CSV_PATH)
+        # Store gzip-compressed with Content-Encoding set: CSV compresses
+        # ~10x, and GCS transparently decompresses for plain downloads
+        with open(CSV_PATH, "rb") as f:
+            blob.content_encoding = "gzip"
+            blob.upload_from_string(gzip.compress(f.read()), content_type="text/csv")
         print(f"💾 CSV backed up to Cloud Storage: {BUCKET_NAME}/{CSV_FILENAME}")
         return True
     except Exception as e:
         print(f"❌ Cloud Storage backup failed: {e}")
         return False
 
+# Set once the master object is known to be gzip-encoded. Masters written
+# before the compose path are plain text, and composing a gzip member onto
+# one yields a mixed object no reader can decode.
+master_gzip_verified = False
+
+# Set when a delta append fails. Unlike the old full re-upload, compose
+# never re-sends lost rows, so the master would stay incomplete for good;
+# instead the next poll re-uploads the whole local CSV once.
+gcs_resync_needed = False
+
+def append_rows_to_cloud_storage(rows: List[Dict[str, Any]]):
+    """Append only the new rows to the Cloud Storage CSV via compose"""
+    global master_gzip_verified, gcs_resync_needed
+
+    # Repair a known-incomplete master with a full resync before composing
+    # anything more onto it - the local CSV already holds this poll's rows
+    if gcs_resync_needed:
+        if not save_to_cloud_storage():
+            return False
+        gcs_resync_needed = False
+        return True
+
+    try:
+        client = storage.Client()
+        bucket = client.bucket(BUCKET_NAME)
+        main_blob = bucket.blob(CSV_FILENAME)
+
+        # One-time migration before the first compose: if the existing master
+        # predates gzip storage, re-upload it compressed so every member of
+        # the composed object is a gzip stream
+        if not master_gzip_verified:
+            try:
+                main_blob.reload()
+                if main_blob.content_encoding != "gzip":
+                    print(f"🔁 Re-uploading plain-text master as gzip before first compose")
+                    raw = main_blob.download_as_bytes()
+                    main_blob.content_encoding = "gzip"
+                    main_blob.upload_from_string(gzip.compress(raw), content_type="text/csv")
+                master_gzip_verified = True
+            except NotFound:
+                pass  # no master yet: the compose fallback below creates it gzipped
+
+        # Serialize just this poll's rows and concatenate server-side, so the
+        # per-poll upload stays O(delta) instead of re-sending the whole history
+        # Deltas are gzipped too: concatenated gzip members form a valid
+        # multi-member stream, so compose keeps the master decodable
+        buf = io.StringIO()
+        csv.writer(buf).writerows(map(CSV_ROW_GETTER, rows))
+        delta_blob = bucket.blob(f"{CSV_FILENAME}.delta")
+        delta_blob.content_encoding = "gzip"
+        delta_blob.upload_from_string(gzip.compress(buf.getvalue().encode("utf-8")),
+                                      content_type="text/csv")
+        main_blob.content_encoding = "gzip"
+        try:
+            main_blob.compose([main_blob, delta_blob])
+        except NotFound:
+            # No master object yet (first run): fall back to a full upload
+            delta_blob.delete()
+            return save_to_cloud_storage()
+        delta_blob.delete()
+
+        print(f"💾 Appended {len(rows)} rows to Cloud Storage: {BUCKET_NAME}/{CSV_FILENAME}")
+        return True
+    except Exception as e:
+        print(f"❌ Cloud Storage append failed: {e}")
+        gcs_resync_needed = True
+        return False
+
 def load_from_cloud_storage():
     """Load CSV from Cloud Storage"""
     try:
@@ -130,13 +264,15 @@ def load_from_cloud_storage():
         bucket = client.bucket(BUCKET_NAME)
         blob = bucket.blob(CSV_FILENAME)
         
-        if blob.exists():
+        # Attempt the download directly and treat 404 as "no CSV yet" —
+        # a separate exists() check would cost an extra metadata round-trip
+        try:
             blob.download_to_filename(CSV_PATH)
-            print(f"📥 Loaded existing CSV from Cloud Storage")
-            return True
-        else:
+        except NotFound:
             print(f"📝 No existing CSV found in Cloud Storage, will create new one")
             return False
+        print(f"📥 Loaded existing CSV from Cloud Storage")
+        return True
     except Exception as e:
         print(f"❌ Cloud Storage load failed: {e}")
         return False
@@ -154,91 +290,142 @@ def ensure_csv():
         file_size = os.path.getsize(CSV_PATH)
         print(f"📊 Using existing CSV file: {CSV_PATH} (size: {file_size} bytes)")
 
+# Seed the local CSV at import, not under __main__: gunicorn (see Procfile)
+# imports this module without running the dev-server block, and both the
+# download fallback and the compose seeding assume the local copy exists
+print("🔧 Initializing Cloud Storage...")
+if not load_from_cloud_storage():
+    ensure_csv()
+
 # In-memory cache for latest readings only
 latest_cache: Dict[str, Dict[str, Any]] = {}
 
+# Pre-serialized /api/latest payload (plain + gzip) and ETag, refreshed at
+# the end of each poll so the endpoint never re-encodes an unchanged cache
+latest_json_cache = (b"{}", gzip.compress(b"{}"), '"empty"')
+
+# Guards shared state (latest_cache, health counters) since the poll workers
+# and Flask request handlers may touch it concurrently
+state_lock = threading.Lock()
+
+# Held for the duration of a poll so Cloud Scheduler retries (or a manual
+# /api/poll) can't run two polls at once and double the API spend
+poll_lock = threading.Lock()
+
 # Health tracking
 last_poll_at = None
 last_poll_error = None
 rows_written_total = 0
 
 # Air Quality API Helper
-def get_air_quality_data(latitude: float, longitude: float) -> Dict[str, Any]:
+def get_air_quality_data(location: Location) -> Dict[str, Any]:
     if not API_KEY:
         raise ValueError("Google Air Quality API key not configured")
-    
-    headers = {"Content-Type": "application/json"}
-    payload = {
-        "location": {"latitude": latitude, "longitude": longitude},
-        "extraComputations": ["POLLUTANT_CONCENTRATION"],
-        "universalAqi": True
-    }
-    
-    url = f"{AIR_QUALITY_URL}?key={API_KEY}"
-    response = requests.post(url, headers=headers, json=payload, timeout=30)
+
+    response = SESSION.post(REQUEST_URL, headers=REQUEST_HEADERS,
+                            data=REQUEST_BODIES[location.label], timeout=30)
     response.raise_for_status()
-    return response.json()
-
-def parse_air_quality_data(raw_data: Dict[str, Any], location: Dict[str, Any]) -> Dict[str, Any]:
-    parsed = {
-        "timestamp_utc": datetime.now(timezone.utc).isoformat(),
-        "location_label": location["label"],
-        "latitude": location["latitude"],
-        "longitude": location["longitude"],
-        "description": location["description"],
-        "overall_aqi": None,        
-        "pollutants": {}
-    }
-    
-    try:
-        if 'indexes' in raw_data:
-            for index in raw_data['indexes']:
-                if index['code'] == 'uaqi':
-                    parsed['overall_aqi'] = index['aqi']                    
-        
-        if 'pollutants' in raw_data:
-            for pollutant in raw_data['pollutants']:
-                code = pollutant['code']
-                concentration = pollutant.get('concentration', {})
-                parsed['pollutants'][code] = {
-                    'concentration': concentration.get('value'),
-                    'units': concentration.get('units')
-                }
-        
-        return parsed
-    except Exception as e:
-        print(f"Error parsing air quality data: {e}")
-        return parsed
+    return orjson.loads(response.content)
 
-def create_csv_row(parsed_data: Dict[str, Any]) -> Dict[str, Any]:
+def build_csv_row(raw_data: Dict[str, Any], location: Location, poll_ts: str) -> Dict[str, Any]:
+    """Build the flat CSV row straight from the API response"""
     row = {
-        "timestamp_utc": parsed_data["timestamp_utc"],
-        "location_label": parsed_data["location_label"],
-        "latitude": parsed_data["latitude"],
-        "longitude": parsed_data["longitude"],
-        "description": parsed_data["description"],
-        "overall_aqi": parsed_data["overall_aqi"],        
+        "timestamp_utc": poll_ts,
+        "location_label": location.label,
+        "latitude": location.latitude,
+        "longitude": location.longitude,
+        "description": location.description,
+        "overall_aqi": next(
+            (index['aqi'] for index in raw_data.get('indexes', ()) if index['code'] == 'uaqi'),
+            None
+        ),
     }
-    
-    # Initialize pollutant columns
-    for pollutant in POLLUTANT_INFO.keys():
-        column_name = f"{pollutant}_{POLLUTANT_INFO[pollutant]['column_suffix']}"
-        row[column_name] = None
-    
-    # Fill pollutant data
-    for code, info in parsed_data["pollutants"].items():
-        code_upper = code.upper()
-        if code_upper in POLLUTANT_INFO:
-            column_name = f"{code_upper}_{POLLUTANT_INFO[code_upper]['column_suffix']}"
-            row[column_name] = info['concentration']
-    
+
+    # Initialize pollutant columns, then fill in one pass over the response
+    row.update(EMPTY_POLLUTANT_COLUMNS)
+    for pollutant in raw_data.get('pollutants', ()):
+        column_name = POLLUTANT_COLUMNS.get(pollutant['code'].upper())
+        if column_name:
+            row[column_name] = pollutant.get('concentration', {}).get('value')
+
     return row
 
+def prune_latest_cache():
+    """Evict readings for retired sensors or stale poll cycles"""
+    cutoff = (datetime.now(timezone.utc) - timedelta(hours=LATEST_MAX_AGE_HOURS)).isoformat()
+    active_labels = {location.label for location in MONITORING_LOCATIONS}
+    with state_lock:
+        # ISO timestamps from this app share one format, so string
+        # comparison against the cutoff is safe
+        stale = [
+            label for label, row in latest_cache.items()
+            if label not in active_labels or row["timestamp_utc"] < cutoff
+        ]
+        for label in stale:
+            del latest_cache[label]
+    if stale:
+        print(f"🧹 Evicted {len(stale)} stale entries from latest_cache")
+
+def refresh_latest_json_cache():
+    """Re-serialize latest_cache once per poll for /api/latest"""
+    global latest_json_cache
+    # Snapshot under the lock, serialize outside it: keeps the critical
+    # section to a shallow dict copy instead of the whole JSON encode
+    with state_lock:
+        snapshot = dict(latest_cache)
+    payload = orjson.dumps(snapshot)
+    latest_json_cache = (payload, gzip.compress(payload, 6),
+                         f'"{hashlib.md5(payload).hexdigest()}"')
+
+# Snapshot flushing happens off the poll path: poll_once only enqueues a
+# copy of latest_cache; a daemon thread pickles it (protocol 5) to /tmp so
+# a restarted instance starts with warm readings instead of an empty page
+snapshot_queue: queue.Queue = queue.Queue(maxsize=4)
+
+def snapshot_writer():
+    while True:
+        snapshot = snapshot_queue.get()
+        try:
+            tmp_path = SNAPSHOT_PATH + ".tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(snapshot, f, protocol=5)
+            os.replace(tmp_path, SNAPSHOT_PATH)
+        except Exception as e:
+            print(f"❌ Snapshot flush failed: {e}")
+        finally:
+            snapshot_queue.task_done()
+
+threading.Thread(target=snapshot_writer, daemon=True).start()
+
+def queue_latest_snapshot():
+    with state_lock:
+        snapshot = dict(latest_cache)
+    try:
+        snapshot_queue.put_nowait(snapshot)
+    except queue.Full:
+        pass  # an earlier snapshot is still pending; this one can be dropped
+
+def load_latest_snapshot():
+    """Warm latest_cache from the last flushed snapshot, if any"""
+    try:
+        if os.path.exists(SNAPSHOT_PATH):
+            with open(SNAPSHOT_PATH, "rb") as f:
+                latest_cache.update(pickle.load(f))
+            print(f"📥 Restored {len(latest_cache)} cached readings from {SNAPSHOT_PATH}")
+            refresh_latest_json_cache()
+    except Exception as e:
+        print(f"❌ Snapshot restore failed: {e}")
+
+load_latest_snapshot()
+
 def poll_once():
     global last_poll_at, last_poll_error, rows_written_total
     
-    print(f"🚀 Starting poll at {datetime.now(timezone.utc).isoformat()}")
-    
+    # One timestamp for the whole poll cycle: every row in the batch shares
+    # it, so readings sort/group cleanly and we skip per-row datetime work
+    poll_ts = datetime.now(timezone.utc).isoformat()
+    print(f"🚀 Starting poll at {poll_ts}")
+
     if not API_KEY:
         last_poll_error = "GOOGLE_AIR_QUALITY_API_KEY is not set"
         print("❌ ERROR: GOOGLE_AIR_QUALITY_API_KEY is not set", file=sys.stderr)
@@ -246,36 +433,49 @@ def poll_once():
 
     all_rows = []
     successful_locations = 0
+
+    def poll_location(location):
+        raw_data = get_air_quality_data(location)
+        return build_csv_row(raw_data, location, poll_ts)
+
+    # The poll is I/O-bound (one HTTP round-trip per location), so fan the
+    # requests out over a thread pool instead of paying latency serially
+    with ThreadPoolExecutor(max_workers=POLL_WORKERS) as executor:
+        futures = {
+            executor.submit(poll_location, location): location
+            for location in MONITORING_LOCATIONS
+        }
+        for future in as_completed(futures):
+            location = futures[future]
+            try:
+                csv_row = future.result()
+                all_rows.append(csv_row)
+
+                with state_lock:
+                    latest_cache[location.label] = csv_row
+                successful_locations += 1
+                print(f"✅ {location.label} - AQI: {csv_row['overall_aqi']}")
+
+            except Exception as e:
+                error_msg = f"{location.label}: {str(e)}"
+                with state_lock:
+                    last_poll_error = error_msg
+                print(f"❌ ERROR {error_msg}", file=sys.stderr)
     
-    for location in MONITORING_LOCATIONS:
-        try:
-            print(f"🔍 Polling {location['label']}...")
-            raw_data = get_air_quality_data(location["latitude"], location["longitude"])
-            parsed_data = parse_air_quality_data(raw_data, location)
-            csv_row = create_csv_row(parsed_data)
-            all_rows.append(csv_row)
-            
-            latest_cache[location["label"]] = csv_row
-            successful_locations += 1
-            print(f"✅ {location['label']} - AQI: {csv_row['overall_aqi']}")
-            
-        except Exception as e:
-            error_msg = f"{location['label']}: {str(e)}"
-            last_poll_error = error_msg
-            print(f"❌ ERROR {error_msg}", file=sys.stderr)
-    
-    last_poll_at = datetime.now(timezone.utc).isoformat()
-    
+    last_poll_at = poll_ts
+    prune_latest_cache()
+    refresh_latest_json_cache()
+    queue_latest_snapshot()
+
     if all_rows:
-        # Append to local CSV
-        with open(CSV_PATH, "a", newline="", encoding="utf-8") as f:
-            writer = csv.DictWriter(f, fieldnames=CSV_HEADER)
-            for row in all_rows:
-                writer.writerow(row)
-                rows_written_total += 1
-        
-        # Save to Cloud Storage
-        cloud_success = save_to_cloud_storage()
+        # Append to local CSV in one buffered batch write
+        with open(CSV_PATH, "a", newline="", encoding="utf-8", buffering=1 << 20) as f:
+            csv.writer(f).writerows(map(CSV_ROW_GETTER, all_rows))
+        with state_lock:
+            rows_written_total += len(all_rows)
+
+        # Append just this poll's rows to Cloud Storage
+        cloud_success = append_rows_to_cloud_storage(all_rows)
         
         print(f"📈 Added {len(all_rows)} rows. Cloud Storage: {'✅' if cloud_success else '❌'}")
         last_poll_error = None
@@ -292,7 +492,12 @@ def poll_once():
 def trigger_poll():
     """Endpoint for Cloud Scheduler to trigger polling"""
     print("🎯 Cloud Scheduler triggered poll")
-    result = poll_once()
+    if not poll_lock.acquire(blocking=False):
+        return jsonify({"status": "skipped", "message": "Poll already in progress"}), 202
+    try:
+        result = poll_once()
+    finally:
+        poll_lock.release()
     return jsonify(result)
 
 # Health check endpoint
@@ -304,10 +509,9 @@ def health_check():
         "service": "Yerevan Air Quality Monitor"
     })
 
-# Web Portal
-@app.route("/")
-def index():
-    html = '''
+# Web Portal — the page is static apart from the location count, so render
+# it once at import time and serve the same bytes on every request
+INDEX_HTML = ('''
 <!doctype html>
 <html>
 <head>
@@ -436,13 +640,33 @@ refreshData();
 
 </body>
 </html>
-'''
-    return Response(html, mimetype="text/html")
+''').encode("utf-8")
+
+# Compressed once at import; ~4 KB of markup shrinks to about a quarter
+INDEX_HTML_GZ = gzip.compress(INDEX_HTML, 9)
+
+@app.route("/")
+def index():
+    if "gzip" in request.headers.get("Accept-Encoding", ""):
+        return Response(INDEX_HTML_GZ, mimetype="text/html",
+                        headers={"Content-Encoding": "gzip",
+                                 "Vary": "Accept-Encoding",
+                                 "Cache-Control": "public, max-age=300"})
+    return Response(INDEX_HTML, mimetype="text/html",
+                    headers={"Vary": "Accept-Encoding",
+                             "Cache-Control": "public, max-age=300"})
 
 # API Endpoints
 @app.route("/api/latest")
 def api_latest():
-    return jsonify(latest_cache)
+    payload, payload_gz, etag = latest_json_cache
+    if request.headers.get("If-None-Match") == etag:
+        return "", 304
+    headers = {"ETag": etag, "Cache-Control": "max-age=30", "Vary": "Accept-Encoding"}
+    if "gzip" in request.headers.get("Accept-Encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+        return Response(payload_gz, mimetype="application/json", headers=headers)
+    return Response(payload, mimetype="application/json", headers=headers)
 
 #@app.route("/download.csv")
 #def download_csv():
@@ -451,46 +675,51 @@ def api_latest():
 @app.route("/download.csv")
 def download_csv():
     try:
-        # Create a temporary file
-        temp_path = "/tmp/download_temp.csv"
-        
-        # Download from Cloud Storage
+        # Redirect to a short-lived signed URL so GCS serves the bytes
+        # directly instead of round-tripping the whole file through the app
         client = storage.Client()
         bucket = client.bucket(BUCKET_NAME)
         blob = bucket.blob(CSV_FILENAME)
-        
-        if not blob.exists():
-            return "CSV file not found in Cloud Storage", 404
-            
-        blob.download_to_filename(temp_path)
-        
-        return send_file(
-            temp_path, 
-            as_attachment=True, 
-            download_name="yerevan_air_quality_data.csv",
-            mimetype="text/csv"
+
+        url = blob.generate_signed_url(
+            version="v4",
+            expiration=timedelta(minutes=10),
+            response_disposition='attachment; filename="yerevan_air_quality_data.csv"'
         )
+        return redirect(url, code=302)
     except Exception as e:
-        print(f"❌ Error downloading CSV: {e}")
+        # The local CSV is authoritative (every poll appends to it before
+        # the GCS backup), so serve it directly rather than failing when
+        # signing is unavailable
+        print(f"❌ Error signing CSV URL, serving local copy: {e}")
+        if os.path.exists(CSV_PATH):
+            return send_file(
+                CSV_PATH,
+                as_attachment=True,
+                download_name="yerevan_air_quality_data.csv",
+                mimetype="text/csv",
+                conditional=True
+            )
         return f"Error downloading CSV: {e}", 500
 
 
 @app.route("/api/health")
 def api_health():
-    return jsonify({
-        "last_poll_at": last_poll_at,
-        "last_poll_error": last_poll_error,
-        "rows_written_total": rows_written_total,
-        "locations_monitored": len(MONITORING_LOCATIONS),
-        "service_url": "https://armeniapollutionanalysis-578058838716.europe-west1.run.app"
-    })
+    with state_lock:
+        payload = orjson.dumps({
+            "last_poll_at": last_poll_at,
+            "last_poll_error": last_poll_error,
+            "rows_written_total": rows_written_total,
+            "locations_monitored": len(MONITORING_LOCATIONS),
+            "service_url": "https://armeniapollutionanalysis-578058838716.europe-west1.run.app"
+        })
+    # Health only changes when a poll runs, so an ETag lets pollers get 304s
+    etag = f'"{hashlib.md5(payload).hexdigest()}"'
+    if request.headers.get("If-None-Match") == etag:
+        return "", 304
+    return Response(payload, mimetype="application/json", headers={"ETag": etag})
 
 if __name__ == "__main__":
-    # Load from Cloud Storage or create new
-    print("🔧 Initializing Cloud Storage...")
-    if not load_from_cloud_storage():
-        ensure_csv()
-    
     # Do one initial poll at startup
     print(f"🚀 Starting Yerevan Air Quality Monitor")
     print(f"📍 Monitoring {len(MONITORING_LOCATIONS)} locations")
@@ -502,5 +731,7 @@ if __name__ == "__main__":
     # Initial poll
     poll_once()
     
+    # Dev fallback only — production runs under gunicorn (see Procfile) so a
+    # long /api/poll does not block /api/latest and /download.csv
     print(f"🌐 Starting web server on {HOST}:{PORT}")
-    app.run(host=HOST, port=PORT, debug=False)
+    app.run(host=HOST, port=PORT, debug=False, threaded=True)
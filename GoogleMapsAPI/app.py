@@ -1,9 +1,17 @@
 #!/usr/bin/env python3
-import os, csv, json, time, sys
+import os, csv, gzip, hashlib, io, json, logging, queue, threading, time, sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import islice
+from operator import itemgetter
 from datetime import datetime, timezone
 from typing import List, Dict, Any
+import orjson
 import requests
-from flask import Flask, jsonify, send_file, Response
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from flask import Flask, request, send_file, Response
+from google.api_core.exceptions import NotFound
 from google.cloud import storage
 
 
@@ -13,6 +21,9 @@ from google.cloud import storage
 CSV_PATH = os.getenv("CSV_PATH", "traffic_observations.csv")
 CORRIDORS_JSON = os.getenv("CORRIDORS_JSON", "routes_network_bidrectional.json")
 PLOT_WINDOW_LIMIT = int(os.getenv("PLOT_WINDOW_LIMIT", "150"))
+# Per-corridor history bound; covers the plot window and /api/history's
+# default limit so eviction is O(1) instead of periodic full scans
+HISTORY_MAXLEN = max(200, PLOT_WINDOW_LIMIT)
 HOST = os.getenv("HOST", "0.0.0.0")
 PORT = int(os.getenv("PORT", "8080"))
 
@@ -21,22 +32,61 @@ GCS_BUCKET_NAME = os.getenv("GCS_BUCKET_NAME", "yerevan-traffic-data")
 GCS_CSV_PATH = os.getenv("GCS_CSV_PATH", "traffic_observations.csv")
 GCS_CORRIDORS_PATH = os.getenv("GCS_CORRIDORS_PATH", "routes_network_bidrectional.json")
 USE_GCS = os.getenv("USE_GCS", "false").lower() == "true"
+# One fsync per poll batch, opt-in: the local CSV is scratch on Cloud Run
+# (GCS is the durable copy), so crash-safety of the local file is optional
+CSV_FSYNC = os.getenv("CSV_FSYNC", "0") == "1"
 
 ROUTES_URL = "https://routes.googleapis.com/directions/v2:computeRoutes"
 FIELD_MASK = "routes.duration,routes.distanceMeters,routes.staticDuration,routes.travelAdvisory"
 
+# Structured logging instead of per-line print/flush on the hot path;
+# per-corridor chatter sits at DEBUG so production (INFO by default) logs
+# one line per poll, not fifty
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"),
+                    format="%(levelname)s %(message)s")
+logger = logging.getLogger("traffic")
+
+# Shared HTTP session so successive polls reuse keep-alive connections to
+# routes.googleapis.com instead of paying a TCP+TLS handshake per corridor
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    # allowed_methods must include POST explicitly - urllib3's default set
+    # excludes it, and every routes call is a POST. The route computations
+    # are idempotent reads, so retrying them on 429/5xx is safe.
+    max_retries=Retry(total=3, backoff_factor=0.3,
+                      status_forcelist=[429, 500, 502, 503, 504],
+                      allowed_methods=frozenset({"POST"})),
+))
 
-app = Flask(__name__)
 
-# Initialize GCS client
+app = Flask(__name__)
+# When a fronting server (nginx/Apache) is configured for it, hand the CSV
+# off via X-Sendfile so the kernel streams it instead of werkzeug chunking
+app.use_x_sendfile = os.getenv("USE_X_SENDFILE", "false").lower() == "true"
+
+# Initialize GCS client. The default transport keeps a small connection
+# pool; with the poller, writer thread and export streaming all talking to
+# GCS concurrently, mount a wider pool so their requests don't queue behind
+# each other. The bucket handle is also built once and shared - it is a
+# plain container object, so per-operation bucket() calls were pure waste.
 gcs_client = None
+gcs_bucket = None
 if USE_GCS:
     try:
-        gcs_client = storage.Client()
-        print(f"GCS client initialized, bucket: {GCS_BUCKET_NAME}")
+        import google.auth
+        from google.auth.transport.requests import AuthorizedSession
+        credentials, project = google.auth.default()
+        auth_session = AuthorizedSession(credentials)
+        auth_session.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=32))
+        gcs_client = storage.Client(project=project, _http=auth_session)
+        gcs_bucket = gcs_client.bucket(GCS_BUCKET_NAME)
+        logger.info(f"GCS client initialized, bucket: {GCS_BUCKET_NAME}")
     except Exception as e:
-        print(f"Warning: Failed to initialize GCS client: {e}")
+        logger.warning(f"Failed to initialize GCS client: {e}")
         gcs_client = None
+        gcs_bucket = None
 
 # ----------------------------
 # File operations with GCS support
@@ -44,13 +94,12 @@ if USE_GCS:
 def load_corridors() -> List[Dict[str, Any]]:
     if USE_GCS and gcs_client:
         try:
-            bucket = gcs_client.bucket(GCS_BUCKET_NAME)
-            blob = bucket.blob(GCS_CORRIDORS_PATH)
+            blob = gcs_bucket.blob(GCS_CORRIDORS_PATH)
             content = blob.download_as_string().decode('utf-8')
-            print(f"Loaded corridors from GCS: {GCS_BUCKET_NAME}/{GCS_CORRIDORS_PATH}")
+            logger.info(f"Loaded corridors from GCS: {GCS_BUCKET_NAME}/{GCS_CORRIDORS_PATH}")
             return json.loads(content)
         except Exception as e:
-            print(f"Failed to load corridors from GCS, falling back to local: {e}")
+            logger.warning(f"Failed to load corridors from GCS, falling back to local: {e}")
     
     # Fallback to local file
     with open(CORRIDORS_JSON, "r", encoding="utf-8") as f:
@@ -58,11 +107,125 @@ def load_corridors() -> List[Dict[str, Any]]:
 
 corridors = load_corridors()
 
+# Corridor requests are independent and network-bound, so they are fanned
+# out across a thread pool; sized to match the session's connection pool
+POLL_WORKERS = min(16, max(1, len(corridors)))
+
+# Static row fields per corridor never change between polls; build them once
+# so each poll only fills in the measured values
+CORRIDOR_ROW_BASE = {
+    c["label"]: {
+        "label": c["label"],
+        "origin_lat": c["origin"]["lat"],
+        "origin_lng": c["origin"]["lng"],
+        "dest_lat": c["dest"]["lat"],
+        "dest_lng": c["dest"]["lng"],
+    }
+    for c in corridors
+}
+
+def build_route_body(c: Dict[str, Any]) -> bytes:
+    """Pre-encoded computeRoutes request body for one corridor."""
+    o = c["origin"]
+    d = c["dest"]
+    body = {
+        "origin": {"location": {"latLng": {"latitude": o["lat"], "longitude": o["lng"]}}},
+        "destination": {"location": {"latLng": {"latitude": d["lat"], "longitude": d["lng"]}}},
+        "travelMode": "DRIVE",
+        "routingPreference": "TRAFFIC_AWARE"
+    }
+
+    # Add waypoints if they exist - THIS LOCKS THE ROUTE
+    if c.get("waypoints"):
+        body["intermediates"] = [
+            {
+                "location": {"latLng": {"latitude": wp["lat"], "longitude": wp["lng"]}},
+                "via": True  # Pass-through points, not stops
+            }
+            for wp in c["waypoints"]
+        ]
+    return orjson.dumps(body)
+
+# Request bodies never change between polls, so encode them once at import
+# and post the raw bytes instead of re-serializing per corridor per poll
+CORRIDOR_BODIES = {c["label"]: build_route_body(c) for c in corridors}
+
 # ----------------------------
 # In-memory caches
 # ----------------------------
+# Request threads read these while the poller mutates them; mutations and
+# any read of the live structures happen under cache_lock. The hot
+# endpoints avoid the lock entirely by reading the pre-serialized bytes,
+# which are swapped atomically.
+cache_lock = threading.Lock()
 latest_cache: Dict[str, Dict[str, Any]] = {}
-history_cache: Dict[str, list] = {}
+history_cache: Dict[str, deque] = {}
+
+# Labels currently present in the corridor file; rows for anything else
+# (e.g. corridors renamed or dropped between deploys) are pruned so the
+# caches stay bounded by the active network instead of its full history
+ACTIVE_LABELS = frozenset(c["label"] for c in corridors)
+
+def prune_stale_labels():
+    """Drop cache entries for labels no longer in the corridor file."""
+    for label in list(latest_cache):
+        if label not in ACTIVE_LABELS:
+            del latest_cache[label]
+    for label in list(history_cache):
+        if label not in ACTIVE_LABELS:
+            del history_cache[label]
+
+def history_tail(series, limit: int) -> list:
+    """Last `limit` points of a history deque as a list."""
+    if limit >= len(series):
+        return list(series)
+    return list(islice(series, len(series) - limit, None))
+
+def history_columns(series, limit: int) -> Dict[str, list]:
+    """Last `limit` points as parallel timestamp/congestion arrays.
+
+    Points without a congestion index are dropped here so the client
+    doesn't have to filter them, and the columnar shape avoids one small
+    JSON array per point.
+    """
+    xs, ys = [], []
+    for ts, cong, _dur in history_tail(series, limit):
+        if cong is not None:
+            xs.append(ts)
+            ys.append(cong)
+    return {"x": xs, "y": ys}
+
+# Serialized responses for the hot read endpoints. The underlying data only
+# changes when a poll lands, so the JSON is built once per poll and served
+# as raw bytes instead of re-serializing on every request.
+latest_json = b"{}"
+latest_json_gz = gzip.compress(latest_json, 6)
+all_history_json = b"{}"
+all_history_json_gz = gzip.compress(all_history_json, 6)
+
+def refresh_json_caches():
+    global latest_json, latest_json_gz, all_history_json, all_history_json_gz
+    latest_json = orjson.dumps(latest_cache)
+    latest_json_gz = gzip.compress(latest_json, 6)
+    all_history_json = orjson.dumps(
+        {label: history_columns(series, PLOT_WINDOW_LIMIT)
+         for label, series in history_cache.items()}
+    )
+    all_history_json_gz = gzip.compress(all_history_json, 6)
+
+def orjson_response(obj) -> Response:
+    return Response(orjson.dumps(obj), mimetype="application/json")
+
+def cached_json_response(raw: bytes, gz: bytes) -> Response:
+    """Serve pre-serialized JSON, gzipped when the client accepts it."""
+    if "gzip" in request.headers.get("Accept-Encoding", ""):
+        resp = Response(gz, mimetype="application/json")
+        resp.headers["Content-Encoding"] = "gzip"
+    else:
+        resp = Response(raw, mimetype="application/json")
+    resp.headers["Vary"] = "Accept-Encoding"
+    resp.headers["Cache-Control"] = "max-age=15"
+    return resp
 
 # After loading corridors, load existing history
 def load_existing_history():
@@ -75,21 +238,20 @@ def load_existing_history():
         # Try to get from GCS first if enabled
         if USE_GCS and gcs_client:
             try:
-                bucket = gcs_client.bucket(GCS_BUCKET_NAME)
-                blob = bucket.blob(GCS_CSV_PATH)
+                blob = gcs_bucket.blob(GCS_CSV_PATH)
                 csv_content = blob.download_as_string().decode('utf-8')
-                print(f"Loaded CSV from GCS: {GCS_BUCKET_NAME}/{GCS_CSV_PATH}")
+                logger.info(f"Loaded CSV from GCS: {GCS_BUCKET_NAME}/{GCS_CSV_PATH}")
                 
                 # Also save locally for other uses
                 with open(CSV_PATH, "w", encoding="utf-8") as f:
                     f.write(csv_content)
                     
             except Exception as e:
-                print(f"Could not load from GCS: {e}")
+                logger.warning(f"Could not load from GCS: {e}")
         
         # If GCS failed or not enabled, try local file
         if csv_content is None and os.path.exists(CSV_PATH):
-            print(f"Loading from local file: {CSV_PATH}")
+            logger.info(f"Loading from local file: {CSV_PATH}")
             with open(CSV_PATH, 'r', encoding='utf-8') as f:
                 csv_content = f.read()
         
@@ -97,7 +259,7 @@ def load_existing_history():
             # Parse CSV content
             reader = csv.DictReader(csv_content.splitlines())
             rows = list(reader)
-            print(f"Total rows in CSV: {len(rows)}")
+            logger.info(f"Total rows in CSV: {len(rows)}")
             
             for row in rows:
                 label = row['label']
@@ -119,20 +281,24 @@ def load_existing_history():
                     pass
                 
                 # Add to history cache
-                history_cache.setdefault(label, []).append(
+                history_cache.setdefault(label, deque(maxlen=HISTORY_MAXLEN)).append(
                     (timestamp, cong_index, duration)
                 )
                 
-                # Update latest (keep the most recent)
+                # Update latest (keep the most recent); the advisory string
+                # is CSV-only and never shipped to browsers
+                row.pop('advisory_json', None)
                 latest_cache[label] = row
             
     except Exception as e:
-        print(f"Could not load existing history: {e}")
+        logger.warning(f"Could not load existing history: {e}")
         import traceback
         traceback.print_exc()
 
 # Call it
 load_existing_history()
+prune_stale_labels()
+refresh_json_caches()
 
 # ----------------------------
 # CSV headers & ensure files
@@ -144,6 +310,10 @@ CSV_HEADER = [
     "advisory_json"
 ]
 
+# Pulls a row dict into a CSV_HEADER-ordered tuple in one C call,
+# so the writers below can use plain csv.writer instead of DictWriter
+CSV_ROW_GETTER = itemgetter(*CSV_HEADER)
+
 def ensure_long_csv():
     if USE_GCS and gcs_client:
         # For GCS, we don't need to create the file in advance
@@ -155,58 +325,145 @@ def ensure_long_csv():
 
 ensure_long_csv()
 
-def append_to_csv(rows: List[Dict[str, Any]]):
-    """Append rows to CSV, both locally and to GCS if enabled"""
-    
-    # Local file append
-    with open(CSV_PATH, "a", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=CSV_HEADER)
-        for row in rows:
-            w.writerow(row)
-    
-    # GCS append (download, append, upload)
-    if USE_GCS and gcs_client:
+# Persistent append handle: only the poller writes rows, so one buffered
+# handle is kept open for the process lifetime instead of reopening per poll.
+# O_APPEND keeps it valid even when the GCS sync rewrites the file in place.
+CSV_FH = None
+CSV_WRITER = None
+
+def get_csv_writer():
+    global CSV_FH, CSV_WRITER
+    if CSV_WRITER is None:
+        CSV_FH = open(CSV_PATH, "a", newline="", encoding="utf-8", buffering=1 << 20)
+        CSV_WRITER = csv.writer(CSV_FH)
+    return CSV_WRITER
+
+def append_to_csv_local(rows: List[Dict[str, Any]]):
+    """Append rows to the local CSV copy."""
+    if not rows:
+        return
+
+    # One writerows call instead of a write per row
+    get_csv_writer().writerows(map(CSV_ROW_GETTER, rows))
+    CSV_FH.flush()
+    if CSV_FSYNC:
+        os.fsync(CSV_FH.fileno())
+
+# Set once the main object is known to be gzip-encoded. Objects written
+# before the compose path are plain text; composing a gzip member onto one
+# produces a mixed object that no reader can decode.
+gcs_master_gzip_verified = False
+
+def append_to_gcs(rows: List[Dict[str, Any]]) -> bool:
+    """Append rows to the GCS CSV object.
+
+    Uploads only the new rows and lets GCS concatenate them onto the main
+    object server-side, so cost per flush stays proportional to the delta
+    instead of the whole history. Returns True once the rows are durable in
+    GCS (or GCS is disabled), False when the flush should be retried.
+    """
+    global gcs_master_gzip_verified
+    if rows and USE_GCS and gcs_client:
         try:
-            bucket = gcs_client.bucket(GCS_BUCKET_NAME)
-            blob = bucket.blob(GCS_CSV_PATH)
-            
-            # Download existing content
+            buf = io.StringIO()
+            csv.writer(buf).writerows(map(CSV_ROW_GETTER, rows))
+
+            # Deltas are stored gzipped (Content-Encoding), so each append
+            # ships ~10x fewer bytes; compose concatenates the members into
+            # a valid multi-member gzip stream and downloads decompress
+            # transparently. Fixed delta name is safe: only the writer
+            # thread appends.
+            delta_blob = gcs_bucket.blob(GCS_CSV_PATH + ".delta")
+            delta_blob.content_encoding = "gzip"
+            delta_blob.upload_from_string(
+                gzip.compress(buf.getvalue().encode("utf-8"), 6),
+                content_type='text/csv')
+
+            main_blob = gcs_bucket.blob(GCS_CSV_PATH)
+
+            # One-time migration before the first compose: a main object
+            # that predates gzip storage must be re-uploaded compressed so
+            # every composed member is a gzip stream
+            if not gcs_master_gzip_verified:
+                try:
+                    main_blob.reload()
+                    if main_blob.content_encoding != "gzip":
+                        logger.info("Re-uploading plain-text GCS CSV as gzip before first compose")
+                        raw = main_blob.download_as_bytes()
+                        main_blob.content_encoding = "gzip"
+                        main_blob.upload_from_string(gzip.compress(raw, 6),
+                                                     content_type='text/csv')
+                    gcs_master_gzip_verified = True
+                except NotFound:
+                    pass  # no main object yet: the fallback below seeds it gzipped
+
+            main_blob.content_encoding = "gzip"
             try:
-                existing_content = blob.download_as_string().decode('utf-8')
-            except Exception:
-                # File doesn't exist yet, create with header
-                existing_content = ",".join(CSV_HEADER) + "\n"
-            
-            # Append new rows
-            output = existing_content
-            for row in rows:
-                output += ",".join(str(row.get(col, "")) for col in CSV_HEADER) + "\n"
-            
-            # Upload back to GCS
-            blob.upload_from_string(output, content_type='text/csv')
-            print(f"Appended {len(rows)} rows to GCS: {GCS_BUCKET_NAME}/{GCS_CSV_PATH}")
-            
-        except Exception as e:
-            print(f"Error updating GCS CSV: {e}")
+                main_blob.compose([main_blob, delta_blob])
+            except NotFound:
+                # First run: no main object yet, seed it with the header
+                main_blob.upload_from_string(
+                    gzip.compress((",".join(CSV_HEADER) + "\n" + buf.getvalue()).encode("utf-8"), 6),
+                    content_type='text/csv')
+            delta_blob.delete()
+            logger.info(f"Appended {len(rows)} rows to GCS: {GCS_BUCKET_NAME}/{GCS_CSV_PATH}")
 
-def download_csv_from_gcs() -> str:
-    """Download CSV from GCS to local file for serving"""
-    if USE_GCS and gcs_client:
-        try:
-            bucket = gcs_client.bucket(GCS_BUCKET_NAME)
-            blob = bucket.blob(GCS_CSV_PATH)
-            content = blob.download_as_string().decode('utf-8')
-            
-            # Write to local file for serving
-            with open(CSV_PATH, "w", encoding="utf-8") as f:
-                f.write(content)
-                
-            return CSV_PATH
         except Exception as e:
-            print(f"Error downloading from GCS: {e}")
-    
-    return CSV_PATH
-
+            logger.error(f"Error updating GCS CSV: {e}")
+            return False
+    return True
+
+# CSV persistence runs off the poll thread: the poller enqueues each poll's
+# batch and a single daemon thread drains the queue. Bounded so a stuck GCS
+# upload applies backpressure instead of buffering rows without limit.
+write_queue: queue.Queue = queue.Queue(maxsize=8)
+
+# Group commit for GCS: rows hit the local CSV immediately, but the compose
+# round trip is amortized across several polls - flush after this many poll
+# batches or this many seconds, whichever comes first
+GCS_FLUSH_POLLS = int(os.getenv("GCS_FLUSH_POLLS", "5"))
+GCS_FLUSH_SEC = float(os.getenv("GCS_FLUSH_SEC", "300"))
+
+# Cap on rows retained across failed GCS flushes. The local CSV lives on
+# /tmp scratch, so rows dropped here are gone from the durable copy - keep
+# a generous buffer and only shed the oldest if an outage drags on.
+GCS_PENDING_MAX_ROWS = int(os.getenv("GCS_PENDING_MAX_ROWS", "5000"))
+
+def csv_writer_loop():
+    pending: List[Dict[str, Any]] = []
+    pending_polls = 0
+    last_flush = time.monotonic()
+    while True:
+        try:
+            batch = write_queue.get(timeout=GCS_FLUSH_SEC)
+        except queue.Empty:
+            batch = None
+        if batch:
+            try:
+                append_to_csv_local(batch)
+            except Exception as e:
+                logger.error(f"Error writing CSV batch: {e}")
+            pending.extend(batch)
+            pending_polls += 1
+            write_queue.task_done()
+        if not pending:
+            last_flush = time.monotonic()
+        elif (pending_polls >= GCS_FLUSH_POLLS
+                or time.monotonic() - last_flush >= GCS_FLUSH_SEC):
+            if append_to_gcs(pending):
+                pending = []
+                pending_polls = 0
+            else:
+                # Transient GCS error: keep the batch and retry on the next
+                # flush tick instead of dropping it from the durable copy
+                if len(pending) > GCS_PENDING_MAX_ROWS:
+                    dropped = len(pending) - GCS_PENDING_MAX_ROWS
+                    del pending[:dropped]
+                    logger.warning(
+                        f"GCS flush still failing; dropped {dropped} oldest pending rows")
+            last_flush = time.monotonic()
+
+threading.Thread(target=csv_writer_loop, daemon=True, name="csv-writer").start()
 
 # Health tracking
 last_poll_at = None
@@ -217,37 +474,76 @@ rows_written_total = 0
 # Helpers
 # ----------------------------
 def seconds_to_int(s: str):
-    if not s:
+    # The Routes API returns durations as integer seconds with an "s"
+    # suffix (e.g. "612s"); parse that directly and only fall back to the
+    # float roundtrip for the odd fractional value
+    if not s or s[-1] != "s":
         return None
-    s = s.strip()
-    if s.endswith("s"):
+    try:
+        return int(s[:-1])
+    except ValueError:
         try:
             return int(float(s[:-1]))
-        except:
+        except ValueError:
             return None
-    return None
 
 # ----------------------------
 # Poller
 # ----------------------------
-poll_in_progress = False
+# Real mutex, not a boolean flag: acquire is atomic, so two overlapping
+# Cloud Scheduler triggers (or a retry racing the original) can't both
+# pass the check and double-spend Routes API quota
+poll_lock = threading.Lock()
+
+def fetch_corridor(c: Dict[str, Any], headers: Dict[str, str], ts: str):
+    """Fetch one corridor's route and build its row; returns (row, error)."""
+    label = c["label"]
+
+    try:
+        r = SESSION.post(ROUTES_URL, headers=headers, data=CORRIDOR_BODIES[label], timeout=20)
+        r.raise_for_status()
+        data = r.json()
+        route = (data.get("routes") or [{}])[0]
+        dur = seconds_to_int(route.get("duration"))
+        static_dur = seconds_to_int(route.get("staticDuration"))
+        dist = route.get("distanceMeters", None)
+        cong = None
+        if dur and static_dur and static_dur > 0:
+            cong = round(dur / static_dur, 3)
+        advisory = route.get("travelAdvisory", {})
+
+        row = {
+            "timestamp_utc": ts,
+            **CORRIDOR_ROW_BASE[label],
+            "duration_sec": dur,
+            "static_sec": static_dur,
+            "distance_m": dist,
+            "congestion_index": cong,
+            # Kept as a dict; only the CSV writer stringifies it
+            "advisory": advisory
+        }
+        logger.debug(f"{label} - Congestion: {cong}, Duration: {dur}s")
+        return row, None
+
+    except Exception as e:
+        error_msg = f"{label}: {str(e)}"
+        logger.error(error_msg)
+        return None, error_msg
 
 def poll_once():
-    global last_poll_at, last_poll_error, rows_written_total, poll_in_progress
+    global last_poll_at, last_poll_error, rows_written_total
 
-    if poll_in_progress:
-        print("Poll already running, skipping...")
+    if not poll_lock.acquire(blocking=False):
+        logger.info("Poll already running, skipping...")
         return {"status": "skipped", "message": "Poll already in progress"}
 
-    poll_in_progress = True
-
     try:
-        print(f"Starting traffic poll at {datetime.now(timezone.utc).isoformat()}")
+        logger.info(f"Starting traffic poll at {datetime.now(timezone.utc).isoformat()}")
         
         api_key = os.getenv("GOOGLE_MAPS_API_KEY")
         if not api_key:
             last_poll_error = "GOOGLE_MAPS_API_KEY is not set"
-            print("ERROR: GOOGLE_MAPS_API_KEY is not set", file=sys.stderr)
+            logger.error("GOOGLE_MAPS_API_KEY is not set")
             return {"status": "error", "message": "API key not set"}
 
         headers = {
@@ -260,83 +556,57 @@ def poll_once():
         rows = []
         successful_corridors = 0
 
-        for c in corridors:
-            label = c["label"]
-            o = c["origin"]
-            d = c["dest"]
-            
-            # Build the base request body
-            body = {
-                "origin": {"location": {"latLng": {"latitude": o["lat"], "longitude": o["lng"]}}},
-                "destination": {"location": {"latLng": {"latitude": d["lat"], "longitude": d["lng"]}}},
-                "travelMode": "DRIVE",
-                "routingPreference": "TRAFFIC_AWARE"
+        # All corridors are polled concurrently; total wall time is bounded
+        # by the slowest request instead of the sum of all of them
+        with ThreadPoolExecutor(max_workers=POLL_WORKERS) as executor:
+            futures = [executor.submit(fetch_corridor, c, headers, ts) for c in corridors]
+            for future in as_completed(futures):
+                row, error = future.result()
+                if row is not None:
+                    rows.append(row)
+                    successful_corridors += 1
+                else:
+                    last_poll_error = error
+
+        if not rows:
+            # Total outage: keep last_poll_at pointing at the last poll that
+            # produced data so the failure stays visible in /api/health, and
+            # skip the write path entirely
+            return {
+                "status": "error",
+                "corridors_polled": 0,
+                "total_corridors": len(corridors),
+                "error": last_poll_error
             }
-            
-            # Add waypoints if they exist - THIS LOCKS THE ROUTE
-            if "waypoints" in c and c["waypoints"]:
-                body["intermediates"] = [
-                    {
-                        "location": {"latLng": {"latitude": wp["lat"], "longitude": wp["lng"]}},
-                        "via": True  # Pass-through points, not stops
-                    }
-                    for wp in c["waypoints"]
-                ]
-                print(f"{label} - Using {len(c['waypoints'])} waypoints to lock the route")
-            
-            try:
-                r = requests.post(ROUTES_URL, headers=headers, json=body, timeout=20)
-                r.raise_for_status()
-                data = r.json()
-                route = (data.get("routes") or [{}])[0]
-                dur = seconds_to_int(route.get("duration"))
-                static_dur = seconds_to_int(route.get("staticDuration"))
-                dist = route.get("distanceMeters", None)
-                cong = None
-                if dur and static_dur and static_dur > 0:
-                    cong = round(dur / static_dur, 3)
-                advisory = route.get("travelAdvisory", {})
-
-                row = {
-                    "timestamp_utc": ts,
-                    "label": label,
-                    "origin_lat": o["lat"],
-                    "origin_lng": o["lng"],
-                    "dest_lat": d["lat"],
-                    "dest_lng": d["lng"],
-                    "duration_sec": dur,
-                    "static_sec": static_dur,
-                    "distance_m": dist,
-                    "congestion_index": cong,
-                    "advisory_json": json.dumps(advisory, ensure_ascii=False)
-                }
-                rows.append(row)
-                successful_corridors += 1
-                print(f"{label} - Congestion: {cong}, Duration: {dur}s")
-                
-            except Exception as e:
-                error_msg = f"{label}: {str(e)}"
-                last_poll_error = error_msg
-                print(f"ERROR {error_msg}", file=sys.stderr)
 
         last_poll_at = ts
 
-        if rows:
-            # Use new append function that handles both local and GCS
-            append_to_csv(rows)
-            
+        # advisory_json only exists for the CSV; the caches (and hence
+        # the JSON sent to browsers) keep the slimmer row without it
+        csv_rows = [
+            {**row, "advisory_json": orjson.dumps(row["advisory"]).decode()}
+            for row in rows
+        ]
+        for csv_row in csv_rows:
+            del csv_row["advisory"]
+
+        # Hand the batch to the writer thread; local + GCS persistence
+        # no longer sits on the poll's critical path
+        write_queue.put(csv_rows)
+
+        with cache_lock:
             for row in rows:
+                del row["advisory"]
                 rows_written_total += 1
                 latest_cache[row["label"]] = row
-                
-                # Store with proper datetime for plotting
-                dt = datetime.fromisoformat(row["timestamp_utc"].replace('Z', '+00:00'))
-                history_cache.setdefault(row["label"], []).append(
+                history_cache.setdefault(row["label"], deque(maxlen=HISTORY_MAXLEN)).append(
                     (row["timestamp_utc"], row["congestion_index"], row["duration_sec"])
                 )
 
             last_poll_error = None
-        
+            prune_stale_labels()
+            refresh_json_caches()
+
         return {
             "status": "success",
             "corridors_polled": successful_corridors,
@@ -344,7 +614,7 @@ def poll_once():
             "timestamp": last_poll_at
         }
     finally:
-        poll_in_progress = False
+        poll_lock.release()
         
 # ----------------------------
 # Cloud Scheduler Endpoint
@@ -352,16 +622,18 @@ def poll_once():
 @app.route("/api/poll", methods=['POST', 'GET'])
 def trigger_poll():
     """Endpoint for Cloud Scheduler to trigger polling"""
-    print("Cloud Scheduler triggered traffic poll")
+    logger.info("Cloud Scheduler triggered traffic poll")
     result = poll_once()
-    return jsonify(result)
+    if result.get("status") == "skipped":
+        return orjson_response(result), 202
+    return orjson_response(result)
 
 # ----------------------------
 # Web portal
 # ----------------------------
-@app.route("/")
-def index():
-    html = '''
+# The page only depends on import-time config (USE_GCS, bucket names,
+# PLOT_WINDOW_LIMIT), so it is rendered and encoded once at module load
+INDEX_HTML = ('''
 <!doctype html>
 <html>
 <head>
@@ -562,14 +834,14 @@ async function buildChart(){
 
   const labels = Object.keys(allRoutesData).sort();
   const datasets = labels.map((label, i) => {
-    const raw = (allRoutesData[label] || []).filter(p => p && p[1] != null);
-    
-    // Use the FULL ISO timestamp, not just time
-    const points = raw.map(p => {
+    // Columnar series: parallel x (full ISO timestamps) and y arrays,
+    // nulls already dropped server-side
+    const series = allRoutesData[label] || { x: [], y: [] };
+    const points = series.x.map((ts, idx) => {
       return {
-        x: p[0],  // Use the full ISO timestamp string (e.g., "2026-03-09T08:30:00Z")
-        y: p[1],
-        fullTime: luxon.DateTime.fromISO(p[0]).toLocaleString(luxon.DateTime.DATETIME_MED)
+        x: ts,
+        y: series.y[idx],
+        fullTime: luxon.DateTime.fromISO(ts).toLocaleString(luxon.DateTime.DATETIME_MED)
       };
     });
 
@@ -686,52 +958,112 @@ setInterval(refreshTable, 15000);
 </script>
 </body>
 </html>
-'''
-    return Response(html, mimetype="text/html")
+''').encode("utf-8")
+INDEX_HTML_GZ = gzip.compress(INDEX_HTML, 6)
+INDEX_HTML_ETAG = f'"{hashlib.md5(INDEX_HTML).hexdigest()}"'
+
+@app.route("/")
+def index():
+    if request.headers.get("If-None-Match") == INDEX_HTML_ETAG:
+        return Response(status=304)
+    if "gzip" in request.headers.get("Accept-Encoding", ""):
+        resp = Response(INDEX_HTML_GZ, mimetype="text/html")
+        resp.headers["Content-Encoding"] = "gzip"
+    else:
+        resp = Response(INDEX_HTML, mimetype="text/html")
+    resp.headers["ETag"] = INDEX_HTML_ETAG
+    resp.headers["Vary"] = "Accept-Encoding"
+    resp.headers["Cache-Control"] = "public, max-age=300"
+    return resp
 
 # ----------------------------
 # Data endpoints
 # ----------------------------
 @app.route("/api/labels")
 def api_labels():
-    return jsonify([c["label"] for c in corridors])
+    return orjson_response([c["label"] for c in corridors])
 
 @app.route("/api/latest")
 def api_latest():
-    return jsonify(latest_cache)
+    return cached_json_response(latest_json, latest_json_gz)
 
 @app.route("/api/history")
 def api_history():
-    from flask import request
     label = request.args.get("label")
     limit = int(request.args.get("limit", "200"))
-    series = history_cache.get(label, [])
-    return jsonify(series[-limit:])
+    with cache_lock:
+        series = history_cache.get(label, ())
+        tail = history_tail(series, limit)
+    return orjson_response(tail)
 
 @app.route("/api/all_history")
 def api_all_history():
-    from flask import request
-    limit = int(request.args.get("limit", "150"))
-    out = {}
-    for label, series in history_cache.items():
-        out[label] = series[-limit:]
+    limit = int(request.args.get("limit", str(PLOT_WINDOW_LIMIT)))
 
-    # Add debug info
-    print(f"API all_history called - returning {sum(len(v) for v in out.values())} total points")
-    print(f"Labels in response: {list(out.keys())}")
+    # The portal always asks for PLOT_WINDOW_LIMIT, so that answer is
+    # pre-serialized once per poll
+    if limit == PLOT_WINDOW_LIMIT:
+        return cached_json_response(all_history_json, all_history_json_gz)
 
-    return jsonify(out)
+    out = {}
+    with cache_lock:
+        for label, series in history_cache.items():
+            out[label] = history_columns(series, limit)
+    return orjson_response(out)
 
 @app.route("/export.csv")
 def export_csv():
+    # Cheap change marker: the CSV only grows when a poll writes rows, so
+    # an unchanged client gets a 304 before we even touch GCS
+    etag = f'W/"{rows_written_total}-{last_poll_at}"'
+    if request.headers.get("If-None-Match") == etag:
+        return Response(status=304)
+
+    resp = None
     if USE_GCS and gcs_client:
-        # Ensure we have the latest from GCS
-        download_csv_from_gcs()
-    return send_file(CSV_PATH, as_attachment=True, download_name="traffic_observations.csv")
+        blob = gcs_bucket.blob(GCS_CSV_PATH)
+        try:
+            # Surfaces a missing object (fresh bucket before the first
+            # group-commit flush) or a GCS outage here, before we commit
+            # to streaming, so we can still fall back to the local file
+            blob.reload()
+            if (blob.content_encoding == "gzip"
+                    and "gzip" in request.headers.get("Accept-Encoding", "")):
+                # The blob is stored gzipped: stream the raw compressed bytes
+                # straight through and let the browser decompress
+                def stream():
+                    with blob.open("rb", raw_download=True, chunk_size=1 << 20) as f:
+                        while True:
+                            chunk = f.read(1 << 20)
+                            if not chunk:
+                                break
+                            yield chunk
+                resp = Response(stream(), mimetype="text/csv")
+                resp.headers["Content-Encoding"] = "gzip"
+            else:
+                # Non-gzip client, or a legacy plain-text object that the
+                # first compose has not migrated yet: let the client library
+                # handle any decompression and send plain CSV
+                resp = Response(blob.download_as_bytes(), mimetype="text/csv")
+            resp.headers["Content-Disposition"] = "attachment; filename=traffic_observations.csv"
+            resp.headers["Vary"] = "Accept-Encoding"
+        except NotFound:
+            resp = None  # nothing flushed to GCS yet
+        except Exception as e:
+            logger.error(f"GCS export failed, serving local CSV: {e}")
+            resp = None
+    if resp is None:
+        # Local copy is authoritative between GCS flushes: append_to_csv_local
+        # writes it on every poll
+        resp = send_file(CSV_PATH, as_attachment=True, conditional=True,
+                         download_name="traffic_observations.csv")
+    resp.headers["ETag"] = etag
+    resp.headers["Cache-Control"] = "private, max-age=30"
+    return resp
 
 @app.route("/api/health")
 def api_health():
-    return jsonify({
+    return orjson_response({
         "last_poll_at": last_poll_at,
         "last_poll_error": last_poll_error,
         "rows_written_total": rows_written_total,
@@ -745,14 +1077,14 @@ def api_health():
 # Main
 # ----------------------------
 if __name__ == "__main__":
-    print(f"Starting Yerevan Traffic Monitor")
-    print(f"Monitoring {len(corridors)} corridors")
-    print(f"GCS Storage: {'Enabled' if USE_GCS else 'Disabled'}")
+    logger.info("Starting Yerevan Traffic Monitor")
+    logger.info(f"Monitoring {len(corridors)} corridors")
+    logger.info(f"GCS Storage: {'Enabled' if USE_GCS else 'Disabled'}")
     if USE_GCS:
-        print(f"GCS Bucket: {GCS_BUCKET_NAME}")
+        logger.info(f"GCS Bucket: {GCS_BUCKET_NAME}")
     
     # Initial poll at startup
     poll_once()
     
-    print(f"Starting web server on {HOST}:{PORT}")
+    logger.info(f"Starting web server on {HOST}:{PORT}")
     app.run(host=HOST, port=PORT, debug=False)